@@ -0,0 +1,46 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List
+
+class AsyncBatchEngine:
+    def __init__(self, processing_function: Callable[[List[Any]], Awaitable[List[Any]]], batch_size: int = 16, wait_timeout: float = 0.01):
+        self.processing_function = processing_function
+        self.batch_size = batch_size
+        self.wait_timeout = wait_timeout
+        self._pending = []
+        self._worker = None
+    
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and self._worker.get_loop() is not loop:
+            self._pending = []
+            self._worker = None
+        
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if self._worker is None:
+            self._worker = loop.create_task(self._drain())
+        return await future
+    
+    async def _drain(self):
+        try:
+            while self._pending:
+                if len(self._pending) < self.batch_size:
+                    await asyncio.sleep(self.wait_timeout)
+                
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                
+                try:
+                    results = await self.processing_function([item for item, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            if self._worker is asyncio.current_task():
+                self._worker = None
@@ -1,52 +1,220 @@
 import ast
+import asyncio
+import math
 import re
-from typing import Dict, Any
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from hashlib import blake2b
+from operator import itemgetter
+from typing import Dict, Any, List
 
-async def extract_functions(state: Dict[str, Any]) -> Dict[str, Any]:
+from batching import AsyncBatchEngine
+from idempotency import idempotent_on
+from storage import load_functions, store_functions
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+_AST_CACHE: OrderedDict[bytes, tuple] = OrderedDict()
+_AST_CACHE_MAXSIZE = 128
+_EXTRACTOR_VERSION = 2
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+_BRANCH_NODES = (ast.If, ast.For, ast.While, ast.BoolOp)
+_COMPLEXITY_BOUNDS = (10, 20)
+_COMPLEXITY_LEVELS = ('low', 'medium', 'high')
+_get_complexity = itemgetter('complexity')
+_DEF_RE = re.compile(r'^\s*def\s+(\w+)')
+_SCAN_PATTERNS = (
+    ('global_count', r'\bglobal\s'),
+    ('bare_except', r'\bexcept\s*:'),
+)
+_SCAN_RE = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in _SCAN_PATTERNS), re.ASCII)
+_SCAN_LOCK = threading.Lock()
+
+def _compile_scan_database():
+    if hyperscan is None:
+        return None
+    database = hyperscan.Database()
+    database.compile(
+        expressions=[pattern.encode('utf-8') for _, pattern in _SCAN_PATTERNS],
+        ids=list(range(len(_SCAN_PATTERNS))),
+        elements=len(_SCAN_PATTERNS),
+        flags=[hyperscan.HS_FLAG_UTF8] * len(_SCAN_PATTERNS)
+    )
+    return database
+
+_SCAN_DB = _compile_scan_database()
+
+def _function_info(node: ast.AST) -> Dict[str, Any]:
+    return {
+        'name': node.name,
+        'line_start': node.lineno,
+        'args_count': len(node.args.args),
+        'body_length': len(node.body)
+    }
+
+def _function_key(func: Dict[str, Any]) -> str:
+    return f"{func['name']}:{func['line_start']}"
+
+class _FunctionCollector(ast.NodeVisitor):
+    def __init__(self, functions: list):
+        self.functions = functions
+    
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.functions.append(_function_info(node))
+    
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+def _on_scan_match(pattern_id: int, start: int, end: int, flags: int, counts: list):
+    counts[pattern_id] += 1
+
+def _code_key(code: str) -> bytes:
+    return blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+def _scan_code(code: str) -> Dict[str, Any]:
+    data = None
+    if _SCAN_DB is not None:
+        try:
+            data = code.encode('utf-8')
+        except UnicodeEncodeError:
+            pass
+    
+    if data is not None:
+        counts = [0] * len(_SCAN_PATTERNS)
+        with _SCAN_LOCK:
+            _SCAN_DB.scan(data, match_event_handler=_on_scan_match, context=counts)
+    else:
+        found = Counter(match.lastgroup for match in _SCAN_RE.finditer(code))
+        counts = [found[name] for name, _ in _SCAN_PATTERNS]
+    
+    global_count, bare_except = counts
+    return {'global_count': global_count, 'bare_except': bare_except > 0}
+
+def _cache_functions(key: bytes, functions: list) -> tuple:
+    cached = _AST_CACHE[key] = tuple(map(dict, functions))
+    _AST_CACHE.move_to_end(key)
+    if len(_AST_CACHE) > _AST_CACHE_MAXSIZE:
+        _AST_CACHE.popitem(last=False)
+    return cached
+
+def _analyze_tree(tree: ast.AST) -> Dict[str, Any]:
+    functions = []
+    complexity_raw = {}
+    global_count = 0
+    bare_except = False
+    
+    stack = [(tree, None)]
+    while stack:
+        node, owner = stack.pop()
+        if owner is None and isinstance(node, _FUNCTION_NODES):
+            info = _function_info(node)
+            functions.append(info)
+            owner = _function_key(info)
+            complexity_raw[owner] = 0
+        elif isinstance(node, _BRANCH_NODES):
+            if owner is not None:
+                complexity_raw[owner] += 1
+        elif isinstance(node, ast.Global):
+            global_count += 1
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            bare_except = True
+        stack.extend((child, owner) for child in reversed(list(ast.iter_child_nodes(node))))
+    
+    return {
+        'functions': functions,
+        'function_count': len(functions),
+        'issues_raw': {'global_count': global_count, 'bare_except': bare_except},
+        'complexity_raw': complexity_raw
+    }
+
+async def analyze_code(state: Dict[str, Any]) -> Dict[str, Any]:
     code = state.get('code', '')
+    
+    try:
+        tree = await asyncio.to_thread(ast.parse, code)
+    except:
+        return await extract_functions(state)
+    
+    result = await asyncio.to_thread(_analyze_tree, tree)
+    _cache_functions(_code_key(code), result['functions'])
+    
+    return result
+
+def _fallback_functions(code: str) -> list:
+    functions = []
+    def_match = _DEF_RE.match
+    for i, line in enumerate(code.split('\n')):
+        match = def_match(line)
+        if match:
+            functions.append({
+                'name': match.group(1),
+                'line_start': i + 1,
+                'args_count': line.count(',') + 1 if '(' in line else 0,
+                'body_length': 1
+            })
+    return functions
+
+def _walk_functions(tree: ast.AST) -> list:
     functions = []
+    _FunctionCollector(functions).visit(tree)
+    return functions
+
+def _extract_sync(code: str) -> list:
+    functions = load_functions(code, _EXTRACTOR_VERSION)
+    if functions is not None:
+        return functions
     
     try:
-        tree = ast.parse(code)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                functions.append({
-                    'name': node.name,
-                    'line_start': node.lineno,
-                    'args_count': len(node.args.args),
-                    'body_length': len(node.body)
-                })
+        functions = _walk_functions(ast.parse(code))
     except:
-        lines = code.split('\n')
-        for i, line in enumerate(lines):
-            if line.strip().startswith('def '):
-                match = re.match(r'def\s+(\w+)', line)
-                if match:
-                    functions.append({
-                        'name': match.group(1),
-                        'line_start': i + 1,
-                        'args_count': line.count(',') + 1 if '(' in line else 0,
-                        'body_length': 1
-                    })
+        functions = _fallback_functions(code)
     
+    store_functions(code, _EXTRACTOR_VERSION, functions)
+    return functions
+
+async def _batch_extract(codes: List[str]) -> List[list]:
+    unique = list(dict.fromkeys(codes))
+    results = await asyncio.gather(*(asyncio.to_thread(_extract_sync, code) for code in unique))
+    extracted = dict(zip(unique, results))
+    return [extracted[code] for code in codes]
+
+_extract_batcher = AsyncBatchEngine(processing_function=_batch_extract, batch_size=16, wait_timeout=0.01)
+
+async def extract_functions(state: Dict[str, Any]) -> Dict[str, Any]:
+    code = state.get('code', '')
+    key = _code_key(code)
+    cached = _AST_CACHE.get(key)
+    if cached is not None:
+        _AST_CACHE.move_to_end(key)
+    else:
+        cached = _cache_functions(key, await _extract_batcher.submit(code))
+    
+    functions = list(map(dict, cached))
     return {'functions': functions, 'function_count': len(functions)}
 
 async def check_complexity(state: Dict[str, Any]) -> Dict[str, Any]:
     functions = state.get('functions', [])
-    complexity_scores = []
-    
-    for func in functions:
-        score = 0
-        score += func.get('args_count', 0) * 2
-        score += func.get('body_length', 0)
-        
-        complexity_scores.append({
+    complexity_raw = state.get('complexity_raw')
+    bounds = _COMPLEXITY_BOUNDS
+    levels = _COMPLEXITY_LEVELS
+    
+    complexity_scores = [
+        {
             'function': func['name'],
             'complexity': score,
-            'level': 'high' if score > 20 else 'medium' if score > 10 else 'low'
-        })
+            'level': levels[bisect_left(bounds, score)]
+        }
+        for func in functions
+        for score in (func['args_count'] * 2 + func['body_length'],)
+    ]
+    if complexity_raw is not None:
+        for entry, func in zip(complexity_scores, functions):
+            entry['branches'] = complexity_raw.get(_function_key(func), 0)
     
-    avg_complexity = sum(s['complexity'] for s in complexity_scores) / len(complexity_scores) if complexity_scores else 0
+    avg_complexity = math.fsum(map(_get_complexity, complexity_scores)) / len(complexity_scores) if complexity_scores else 0
     
     return {
         'complexity_scores': complexity_scores,
@@ -55,28 +223,24 @@ async def check_complexity(state: Dict[str, Any]) -> Dict[str, Any]:
 
 async def detect_issues(state: Dict[str, Any]) -> Dict[str, Any]:
     code = state.get('code', '')
-    issues = []
+    issues_raw = state.get('issues_raw')
+    if issues_raw is None:
+        issues_raw = _scan_code(code)
     
-    if len(code) > 5000:
-        issues.append({'type': 'length', 'message': 'Code is very long', 'severity': 'medium'})
-    
-    if code.count('global ') > 2:
-        issues.append({'type': 'globals', 'message': 'Too many global variables', 'severity': 'high'})
-    
-    if 'except:' in code or 'except :' in code:
-        issues.append({'type': 'exception', 'message': 'Bare except clause found', 'severity': 'medium'})
-    
-    functions = state.get('functions', [])
-    for func in functions:
-        if func.get('args_count', 0) > 5:
-            issues.append({
-                'type': 'parameters',
-                'message': f"Function {func['name']} has too many parameters",
-                'severity': 'medium'
-            })
+    issues = list(filter(None, (
+        len(code) > 5000 and {'type': 'length', 'message': 'Code is very long', 'severity': 'medium'},
+        issues_raw['global_count'] > 2 and {'type': 'globals', 'message': 'Too many global variables', 'severity': 'high'},
+        issues_raw['bare_except'] and {'type': 'exception', 'message': 'Bare except clause found', 'severity': 'medium'}
+    )))
+    issues.extend(
+        {'type': 'parameters', 'message': f"Function {func['name']} has too many parameters", 'severity': 'medium'}
+        for func in state.get('functions', [])
+        if func['args_count'] > 5
+    )
     
     return {'issues': issues, 'issue_count': len(issues)}
 
+@idempotent_on(('issues', 'complexity_scores', 'avg_complexity'))
 async def suggest_improvements(state: Dict[str, Any]) -> Dict[str, Any]:
     issues = state.get('issues', [])
     complexity_scores = state.get('complexity_scores', [])
@@ -108,6 +272,7 @@ async def suggest_improvements(state: Dict[str, Any]) -> Dict[str, Any]:
 def setup_code_review_workflow():
     from main import register_tool
     
+    register_tool('analyze_code', analyze_code)
     register_tool('extract_functions', extract_functions)
     register_tool('check_complexity', check_complexity)
     register_tool('detect_issues', detect_issues)
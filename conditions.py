@@ -0,0 +1,193 @@
+import ast
+import operator
+from typing import Dict, Any, Optional, Callable, Tuple
+
+Predicate = Callable[[Dict[str, Any]], bool]
+StatePath = Tuple[Any, ...]
+
+MISSING = object()
+
+_EVAL_GLOBALS = {'__builtins__': {}}
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
+
+class UnsupportedCondition(Exception):
+    pass
+
+def _build_constant(node: ast.Constant):
+    value = node.value
+    return lambda state: value
+
+def _build_name(node: ast.Name):
+    if node.id != 'state':
+        raise UnsupportedCondition(node.id)
+    return lambda state: state
+
+def _build_subscript(node: ast.Subscript):
+    target = _build(node.value)
+    if isinstance(node.slice, ast.Constant):
+        key = node.slice.value
+        return lambda state: target(state)[key]
+    key_of = _build(node.slice)
+    return lambda state: target(state)[key_of(state)]
+
+def _build_call(node: ast.Call):
+    func = node.func
+    if not (isinstance(func, ast.Attribute) and func.attr == 'get') or node.keywords or not 1 <= len(node.args) <= 2:
+        raise UnsupportedCondition(ast.dump(node))
+    target = _build(func.value)
+    key_of = _build(node.args[0])
+    if len(node.args) == 1:
+        return lambda state: target(state).get(key_of(state))
+    default_of = _build(node.args[1])
+    return lambda state: target(state).get(key_of(state), default_of(state))
+
+def _build_compare(node: ast.Compare):
+    left = _build(node.left)
+    ops = [_COMPARE_OPS[type(op)] for op in node.ops]
+    comparators = [_build(comparator) for comparator in node.comparators]
+
+    if len(ops) == 1:
+        op = ops[0]
+        right = comparators[0]
+        return lambda state: op(left(state), right(state))
+
+    pairs = list(zip(ops, comparators))
+    def compare(state):
+        lhs = left(state)
+        for op, comparator in pairs:
+            rhs = comparator(state)
+            if not op(lhs, rhs):
+                return False
+            lhs = rhs
+        return True
+    return compare
+
+def _build_bool_op(node: ast.BoolOp):
+    values = [_build(value) for value in node.values]
+
+    if isinstance(node.op, ast.And):
+        def all_of(state):
+            result = True
+            for value in values:
+                result = value(state)
+                if not result:
+                    return result
+            return result
+        return all_of
+
+    def any_of(state):
+        result = False
+        for value in values:
+            result = value(state)
+            if result:
+                return result
+        return result
+    return any_of
+
+def _build_unary_op(node: ast.UnaryOp):
+    if not isinstance(node.op, ast.Not):
+        raise UnsupportedCondition(ast.dump(node))
+    operand = _build(node.operand)
+    return lambda state: not operand(state)
+
+_BUILDERS = {
+    ast.Constant: _build_constant,
+    ast.Name: _build_name,
+    ast.Subscript: _build_subscript,
+    ast.Call: _build_call,
+    ast.Compare: _build_compare,
+    ast.BoolOp: _build_bool_op,
+    ast.UnaryOp: _build_unary_op,
+}
+
+def _build(node: ast.AST):
+    builder = _BUILDERS.get(type(node))
+    if builder is None:
+        raise UnsupportedCondition(ast.dump(node))
+    return builder(node)
+
+def _never(state: Dict[str, Any]) -> bool:
+    return False
+
+def compile_condition(condition: Optional[str]) -> Optional[Predicate]:
+    if not condition:
+        return None
+
+    try:
+        tree = ast.parse(condition, mode='eval')
+    except SyntaxError:
+        return _never
+
+    try:
+        evaluate = _build(tree.body)
+    except (UnsupportedCondition, KeyError):
+        code = compile(tree, '<edge>', 'eval')
+        evaluate = lambda state: eval(code, _EVAL_GLOBALS, {'state': state})
+
+    def predicate(state: Dict[str, Any]) -> bool:
+        try:
+            return bool(evaluate(state))
+        except Exception:
+            return False
+
+    return predicate
+
+def _state_path(node: ast.AST) -> Optional[StatePath]:
+    if isinstance(node, ast.Name):
+        return () if node.id == 'state' else None
+    if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant):
+        parent = _state_path(node.value)
+        return None if parent is None else parent + (node.slice.value,)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'get'
+            and not node.keywords and 1 <= len(node.args) <= 2
+            and all(isinstance(arg, ast.Constant) for arg in node.args)):
+        parent = _state_path(node.func.value)
+        return None if parent is None else parent + (node.args[0].value,)
+    return None
+
+def _collect_paths(node: ast.AST, paths: set) -> bool:
+    path = _state_path(node)
+    if path is not None:
+        if not path:
+            return False
+        paths.add(path)
+        return True
+    if isinstance(node, ast.Name):
+        return False
+    return all(_collect_paths(child, paths) for child in ast.iter_child_nodes(node))
+
+def condition_paths(condition: Optional[str]) -> Optional[Tuple[StatePath, ...]]:
+    if not condition:
+        return ()
+    try:
+        tree = ast.parse(condition, mode='eval')
+    except SyntaxError:
+        return ()
+    paths = set()
+    if not _collect_paths(tree.body, paths):
+        return None
+    return tuple(sorted(paths, key=repr))
+
+def resolve_path(state: Dict[str, Any], path: StatePath) -> Tuple[Tuple[type, ...], Any]:
+    containers = []
+    value = state
+    for depth, key in enumerate(path):
+        if depth:
+            containers.append(type(value))
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return tuple(containers), MISSING
+    return tuple(containers), value
@@ -0,0 +1,7 @@
+from typing import Callable, Tuple
+
+def idempotent_on(keys: Tuple[str, ...]) -> Callable:
+    def decorate(func: Callable) -> Callable:
+        func.idempotent_on = tuple(keys)
+        return func
+    return decorate
@@ -1,17 +1,57 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 import asyncio
+import time
 import uuid
+from collections import ChainMap, OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
+from hashlib import blake2b
+from types import MappingProxyType
 import json
+import orjson
 
-app = FastAPI(title="Workflow Engine API")
+from conditions import MISSING, compile_condition, condition_paths, resolve_path
+from storage import BlobTable
 
-workflow_storage = {}
-run_storage = {}
+class FallbackORJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        try:
+            return super().render(content)
+        except TypeError:
+            return json.dumps(content, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+app = FastAPI(title="Workflow Engine API", default_response_class=FallbackORJSONResponse)
+
+workflow_storage = BlobTable('graphs')
+run_storage = BlobTable('runs')
 tool_registry = {}
+engine_templates = OrderedDict()
+
+_ROUTE_KEY_TYPES = (str, int, float, bool, bytes, type(None))
+_LOG_BATCH_WINDOW = 0.005
+_ENGINE_TEMPLATE_CACHE_SIZE = 128
+_ROUTE_CACHE_SIZE = 1024
+_MAX_PARALLELISM = 8
+_LOG_COLUMNS = ('node', 't_us', 'iteration', 'status', 'output', 'error')
+_OPTIONAL_LOG_COLUMNS = frozenset(('output', 'error'))
+
+def _dumps(payload: Any) -> str:
+    try:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return json.dumps(payload)
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return merged
+
+def _ALWAYS_TRUE(state: Dict[str, Any]) -> bool:
+    return True
 
 class NodeConfig(BaseModel):
     name: str
@@ -23,6 +63,26 @@ class EdgeConfig(BaseModel):
     to_node: str
     condition: Optional[str] = None
 
+@dataclass(frozen=True, slots=True)
+class NodeRuntime:
+    name: str
+    tool: str
+    params: Tuple[Tuple[str, Any], ...]
+    
+    @classmethod
+    def from_config(cls, node: NodeConfig) -> "NodeRuntime":
+        return cls(node.name, node.tool, tuple((node.params or {}).items()))
+
+@dataclass(frozen=True, slots=True)
+class EdgeRuntime:
+    from_node: str
+    to_node: str
+    condition: Optional[str]
+    
+    @classmethod
+    def from_config(cls, edge: EdgeConfig) -> "EdgeRuntime":
+        return cls(edge.from_node, edge.to_node, edge.condition)
+
 class GraphCreateRequest(BaseModel):
     nodes: List[NodeConfig]
     edges: List[EdgeConfig]
@@ -33,133 +93,318 @@ class GraphRunRequest(BaseModel):
     initial_state: Dict[str, Any]
 
 class WorkflowEngine:
-    def __init__(self, graph_id: str, nodes: List[NodeConfig], edges: List[EdgeConfig]):
+    def __init__(self, graph_id: str, nodes: List[NodeConfig], edges: List[EdgeConfig],
+                 reducer: Optional[Callable] = None, max_parallelism: int = _MAX_PARALLELISM):
+        self._load_template(graph_id, self.build_template(nodes, edges), reducer, max_parallelism)
+    
+    @classmethod
+    def from_template(cls, graph_id: str, template: MappingProxyType,
+                      reducer: Optional[Callable] = None, max_parallelism: int = _MAX_PARALLELISM) -> "WorkflowEngine":
+        engine = cls.__new__(cls)
+        engine._load_template(graph_id, template, reducer, max_parallelism)
+        return engine
+    
+    @classmethod
+    def build_template(cls, nodes: List[NodeConfig], edges: List[EdgeConfig]) -> MappingProxyType:
+        nodes = [NodeRuntime.from_config(node) for node in nodes]
+        edges = [EdgeRuntime.from_config(edge) for edge in edges]
+        return MappingProxyType({
+            'nodes': MappingProxyType({node.name: node for node in nodes}),
+            'router': MappingProxyType(cls._build_router(edges)),
+            'fanout': MappingProxyType(cls._build_fanout(edges)),
+            'route_paths': MappingProxyType(cls._build_route_paths(edges)),
+            'route_cache': OrderedDict()
+        })
+    
+    def _load_template(self, graph_id: str, template: MappingProxyType,
+                       reducer: Optional[Callable], max_parallelism: int):
         self.graph_id = graph_id
-        self.nodes = {node.name: node for node in nodes}
-        self.edges = self._build_edge_map(edges)
-        self.execution_log = []
-        
-    def _build_edge_map(self, edges: List[EdgeConfig]) -> Dict[str, List[tuple]]:
-        edge_map = {}
+        self.nodes = template['nodes']
+        self._router = template['router']
+        self._fanout = template['fanout']
+        self.reducer = reducer or merge_results
+        self.max_parallelism = max_parallelism
+        self._route_paths = template['route_paths']
+        self._route_cache = template['route_cache']
+        self._idempotent_results = {}
+        self.execution_log = {column: [] for column in _LOG_COLUMNS}
+        self._log_appends = tuple(self.execution_log[column].append for column in _LOG_COLUMNS)
+    
+    @staticmethod
+    def _build_router(edges: List[EdgeRuntime]) -> Dict[str, Tuple[Tuple[Callable, str], ...]]:
+        router = {}
         for edge in edges:
-            if edge.from_node not in edge_map:
-                edge_map[edge.from_node] = []
-            edge_map[edge.from_node].append((edge.to_node, edge.condition))
-        return edge_map
-    
-    def _evaluate_condition(self, condition: str, state: Dict[str, Any]) -> bool:
-        if not condition:
-            return True
-        try:
-            return eval(condition, {"state": state})
-        except:
-            return False
+            predicate = compile_condition(edge.condition) or _ALWAYS_TRUE
+            router.setdefault(edge.from_node, []).append((predicate, edge.to_node))
+        return {node: tuple(routes) for node, routes in router.items()}
+    
+    @staticmethod
+    def _build_fanout(edges: List[EdgeRuntime]) -> Dict[str, Tuple[str, ...]]:
+        fanout = {}
+        for edge in edges:
+            if not edge.condition:
+                fanout.setdefault(edge.from_node, {})[edge.to_node] = None
+        return {node: tuple(targets) for node, targets in fanout.items()}
+    
+    @staticmethod
+    def _build_route_paths(edges: List[EdgeRuntime]) -> Dict[str, Optional[tuple]]:
+        route_paths = {}
+        for edge in edges:
+            paths = condition_paths(edge.condition)
+            known = route_paths.get(edge.from_node, ())
+            if paths is None or known is None:
+                route_paths[edge.from_node] = None
+            else:
+                route_paths[edge.from_node] = known + tuple(p for p in paths if p not in known)
+        return route_paths
+    
+    def _route_key(self, current_node: str, state: Dict[str, Any]) -> Optional[tuple]:
+        paths = self._route_paths.get(current_node)
+        if paths is None:
+            return None
+        values = []
+        for path in paths:
+            containers, value = resolve_path(state, path)
+            if value is MISSING:
+                if containers:
+                    return None
+                values.append(value)
+            elif type(value) in _ROUTE_KEY_TYPES:
+                values.append((containers, type(value), value))
+            else:
+                return None
+        return (current_node, tuple(values))
+    
+    def _get_next_nodes(self, current_node: str, state: Dict[str, Any]) -> Tuple[str, ...]:
+        routes = self._router.get(current_node)
+        if not routes:
+            return ()
+        if routes[0][0] is _ALWAYS_TRUE:
+            return self._fanout[current_node]
+        
+        route_key = self._route_key(current_node, state)
+        if route_key is not None:
+            cached = self._route_cache.get(route_key)
+            if cached is not None:
+                self._route_cache.move_to_end(route_key)
+                return cached
+        
+        selected = ()
+        for predicate, target in routes:
+            if predicate is _ALWAYS_TRUE:
+                selected = self._fanout[current_node]
+                break
+            if predicate(state):
+                selected = (target,)
+                break
+        
+        if route_key is not None:
+            self._route_cache[route_key] = selected
+            if len(self._route_cache) > _ROUTE_CACHE_SIZE:
+                self._route_cache.popitem(last=False)
+        return selected
     
-    def _get_next_node(self, current_node: str, state: Dict[str, Any]) -> Optional[str]:
-        if current_node not in self.edges:
+    def _next_frontier(self, frontier: Tuple[str, ...], state: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(frontier) == 1:
+            return self._get_next_nodes(frontier[0], state)
+        return tuple(dict.fromkeys(
+            target for node_name in frontier for target in self._get_next_nodes(node_name, state)
+        ))
+    
+    def _fingerprint(self, state: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[bytes]:
+        try:
+            payload = orjson.dumps([state.get(key) for key in keys], option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
             return None
+        return blake2b(payload, digest_size=16).digest()
+    
+    async def _run_tool(self, node_name: str, tool_func: Callable, state: Dict[str, Any], params: Tuple[Tuple[str, Any], ...]) -> Dict[str, Any]:
+        keys = getattr(tool_func, 'idempotent_on', None)
+        fingerprint = self._fingerprint(state, keys) if keys else None
+        if fingerprint is not None:
+            previous = self._idempotent_results.get(node_name)
+            if previous is not None and previous[0] == fingerprint:
+                return previous[1]
         
-        for next_node, condition in self.edges[current_node]:
-            if self._evaluate_condition(condition, state):
-                return next_node
-        return None
+        result = await tool_func(state, **dict(params))
+        if fingerprint is not None:
+            self._idempotent_results[node_name] = (fingerprint, result)
+        return result
+    
+    async def _drain(self, websocket):
+        queue = self._log_queue
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(_LOG_BATCH_WINDOW)
+            try:
+                while True:
+                    batch.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                pass
+            
+            done = batch[-1] is None
+            if done:
+                batch.pop()
+            if batch:
+                try:
+                    await websocket.send_text(_dumps({'batch': batch}))
+                except:
+                    pass
+            if done:
+                return
     
     async def execute(self, initial_state: Dict[str, Any], websocket=None) -> Dict[str, Any]:
-        state = initial_state.copy()
-        state['_meta'] = {
-            'start_time': datetime.now().isoformat(),
-            'iterations': 0,
-            'max_iterations': 50
-        }
+        if websocket:
+            self._log_queue = asyncio.Queue()
+            self._drain_task = asyncio.create_task(self._drain(websocket))
         
-        current_node = list(self.nodes.keys())[0] if self.nodes else None
+        try:
+            return await self._execute(initial_state, websocket)
+        finally:
+            if websocket:
+                self._log_queue.put_nowait(None)
+                await self._drain_task
+    
+    async def _run_node(self, node_name: str, state: Dict[str, Any], iteration: int) -> Tuple[tuple, Optional[Dict[str, Any]]]:
+        node_config = self.nodes[node_name]
+        t_us = (time.monotonic_ns() - self._start_ns) // 1000
         
-        while current_node and state['_meta']['iterations'] < state['_meta']['max_iterations']:
-            node_config = self.nodes[current_node]
-            
-            log_entry = {
-                'node': current_node,
-                'timestamp': datetime.now().isoformat(),
-                'iteration': state['_meta']['iterations']
+        if node_config.tool not in tool_registry:
+            return (node_name, t_us, iteration, 'tool_not_found', None, None), None
+        
+        tool_func = tool_registry[node_config.tool]
+        try:
+            result = dict(await self._run_tool(node_name, tool_func, state, node_config.params))
+        except Exception as e:
+            return (node_name, t_us, iteration, 'error', None, str(e)), {'_error': str(e)}
+        return (node_name, t_us, iteration, 'success', result, None), result
+    
+    def _log_row(self, row: tuple) -> Dict[str, Any]:
+        return {
+            column: value for column, value in zip(_LOG_COLUMNS, row)
+            if value is not None or column not in _OPTIONAL_LOG_COLUMNS
+        }
+    
+    def execution_log_rows(self) -> List[Dict[str, Any]]:
+        columns = [self.execution_log[column] for column in _LOG_COLUMNS]
+        return [self._log_row(row) for row in zip(*columns)]
+    
+    async def _run_branch(self, semaphore: asyncio.Semaphore, node_name: str, state: ChainMap, iteration: int):
+        async with semaphore:
+            return await self._run_node(node_name, state.new_child(), iteration)
+    
+    async def _execute(self, initial_state: Dict[str, Any], websocket=None) -> Dict[str, Any]:
+        start_time = time.time()
+        self._start_ns = time.monotonic_ns()
+        semaphore = asyncio.Semaphore(self.max_parallelism)
+        state = ChainMap({
+            '_meta': {
+                'iterations': 0,
+                'max_iterations': 50
             }
-            
-            if node_config.tool in tool_registry:
-                tool_func = tool_registry[node_config.tool]
-                try:
-                    result = await tool_func(state, **node_config.params)
-                    state.update(result)
-                    log_entry['status'] = 'success'
-                    log_entry['output'] = result
-                except Exception as e:
-                    log_entry['status'] = 'error'
-                    log_entry['error'] = str(e)
-                    state['_error'] = str(e)
+        }, initial_state)
+        
+        frontier = (next(iter(self.nodes)),) if self.nodes else ()
+        
+        while frontier and state['_meta']['iterations'] < state['_meta']['max_iterations']:
+            iteration = state['_meta']['iterations']
+            if len(frontier) == 1:
+                outcomes = [await self._run_node(frontier[0], state, iteration)]
             else:
-                log_entry['status'] = 'tool_not_found'
+                frontier = frontier[:state['_meta']['max_iterations'] - iteration]
+                outcomes = await asyncio.gather(*(
+                    self._run_branch(semaphore, node_name, state, iteration + offset)
+                    for offset, node_name in enumerate(frontier)
+                ))
             
-            self.execution_log.append(log_entry)
+            updates = []
+            for row, update in outcomes:
+                for append, value in zip(self._log_appends, row):
+                    append(value)
+                if websocket:
+                    self._log_queue.put_nowait(self._log_row(row))
+                if update is not None:
+                    updates.append(update)
             
-            if websocket:
-                try:
-                    await websocket.send_json(log_entry)
-                except:
-                    pass
+            if len(updates) == 1:
+                state.maps.insert(0, updates[0])
+            elif updates:
+                state.maps.insert(0, self.reducer(updates))
             
-            state['_meta']['iterations'] += 1
-            current_node = self._get_next_node(current_node, state)
+            state['_meta']['iterations'] += len(frontier)
+            frontier = self._next_frontier(frontier, state)
         
-        state['_meta']['end_time'] = datetime.now().isoformat()
-        state['_meta']['execution_log'] = self.execution_log
+        state['_meta']['start_time'] = datetime.fromtimestamp(start_time).isoformat()
+        state['_meta']['end_time'] = datetime.fromtimestamp(time.time()).isoformat()
+        state['_meta']['execution_log'] = self.execution_log_rows()
         
-        return state
+        return dict(state)
 
 def register_tool(name: str, func: Callable):
     tool_registry[name] = func
 
+def _cache_engine_template(graph_id: str, template: MappingProxyType) -> MappingProxyType:
+    engine_templates[graph_id] = template
+    engine_templates.move_to_end(graph_id)
+    if len(engine_templates) > _ENGINE_TEMPLATE_CACHE_SIZE:
+        engine_templates.popitem(last=False)
+    return template
+
+def _get_engine_template(graph_id: str, graph_data: Dict[str, Any]) -> MappingProxyType:
+    template = engine_templates.get(graph_id)
+    if template is not None:
+        engine_templates.move_to_end(graph_id)
+        return template
+    return _cache_engine_template(graph_id, WorkflowEngine.build_template(
+        [NodeConfig(**node) for node in graph_data['nodes']],
+        [EdgeConfig(**edge) for edge in graph_data['edges']]
+    ))
+
 @app.post("/graph/create")
 async def create_graph(request: GraphCreateRequest):
     graph_id = str(uuid.uuid4())
-    workflow_storage[graph_id] = {
-        'nodes': request.nodes,
-        'edges': request.edges,
+    await workflow_storage.set(graph_id, {
+        'nodes': [node.model_dump() for node in request.nodes],
+        'edges': [edge.model_dump() for edge in request.edges],
         'name': request.name,
         'created_at': datetime.now().isoformat()
-    }
+    })
+    _cache_engine_template(graph_id, WorkflowEngine.build_template(request.nodes, request.edges))
     return {"graph_id": graph_id, "message": "Graph created successfully"}
 
 @app.post("/graph/run")
 async def run_graph(request: GraphRunRequest):
-    if request.graph_id not in workflow_storage:
+    graph_data = await workflow_storage.get(request.graph_id)
+    if graph_data is None:
         raise HTTPException(status_code=404, detail="Graph not found")
     
-    graph_data = workflow_storage[request.graph_id]
     run_id = str(uuid.uuid4())
     
-    engine = WorkflowEngine(
-        request.graph_id,
-        [NodeConfig(**node.dict() if hasattr(node, 'dict') else node) for node in graph_data['nodes']],
-        [EdgeConfig(**edge.dict() if hasattr(edge, 'dict') else edge) for edge in graph_data['edges']]
-    )
+    engine = WorkflowEngine.from_template(request.graph_id, _get_engine_template(request.graph_id, graph_data))
     
     final_state = await engine.execute(request.initial_state)
     
-    run_storage[run_id] = {
-        'graph_id': request.graph_id,
-        'state': final_state,
-        'created_at': datetime.now().isoformat()
-    }
+    try:
+        await run_storage.set(run_id, {
+            'graph_id': request.graph_id,
+            'state': final_state,
+            'created_at': datetime.now().isoformat()
+        })
+    except TypeError as e:
+        raise HTTPException(status_code=500, detail=f"Run state cannot be stored: {e}")
     
     return {
         "run_id": run_id,
         "final_state": final_state,
-        "execution_log": engine.execution_log
+        "execution_log": final_state['_meta']['execution_log']
     }
 
 @app.get("/graph/state/{run_id}")
 async def get_run_state(run_id: str):
-    if run_id not in run_storage:
+    run = await run_storage.get(run_id)
+    if run is None:
         raise HTTPException(status_code=404, detail="Run not found")
-    return run_storage[run_id]
+    return run
 
 @app.websocket("/ws/graph/run/{graph_id}")
 async def websocket_run(websocket: WebSocket, graph_id: str):
@@ -169,31 +414,27 @@ async def websocket_run(websocket: WebSocket, graph_id: str):
         data = await websocket.receive_json()
         initial_state = data.get('initial_state', {})
         
-        if graph_id not in workflow_storage:
-            await websocket.send_json({"error": "Graph not found"})
+        graph_data = await workflow_storage.get(graph_id)
+        if graph_data is None:
+            await websocket.send_text(_dumps({"error": "Graph not found"}))
             await websocket.close()
             return
         
-        graph_data = workflow_storage[graph_id]
-        engine = WorkflowEngine(
-            graph_id,
-            [NodeConfig(**node) for node in graph_data['nodes']],
-            [EdgeConfig(**edge) for edge in graph_data['edges']]
-        )
+        engine = WorkflowEngine.from_template(graph_id, _get_engine_template(graph_id, graph_data))
         
         final_state = await engine.execute(initial_state, websocket)
-        await websocket.send_json({"type": "complete", "final_state": final_state})
+        await websocket.send_text(_dumps({"type": "complete", "final_state": final_state}))
         
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        await websocket.send_json({"error": str(e)})
+        await websocket.send_text(_dumps({"error": str(e)}))
     finally:
         await websocket.close()
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "graphs": len(workflow_storage), "runs": len(run_storage)}
+    return {"status": "healthy", "graphs": await workflow_storage.count(), "runs": await run_storage.count()}
 
 if __name__ == "__main__":
     import uvicorn
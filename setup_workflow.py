@@ -7,12 +7,14 @@ def create_code_review_workflow():
     workflow = {
         "name": "Code Review Workflow",
         "nodes": [
+            {"name": "analyze", "tool": "analyze_code", "params": {}},
             {"name": "extract", "tool": "extract_functions", "params": {}},
             {"name": "complexity", "tool": "check_complexity", "params": {}},
             {"name": "issues", "tool": "detect_issues", "params": {}},
             {"name": "improve", "tool": "suggest_improvements", "params": {}}
         ],
         "edges": [
+            {"from_node": "analyze", "to_node": "extract", "condition": None},
             {"from_node": "extract", "to_node": "complexity", "condition": None},
             {"from_node": "complexity", "to_node": "issues", "condition": None},
             {"from_node": "issues", "to_node": "improve", "condition": None},
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Optional, Tuple
+
+import orjson
+
+DB_PATH = os.environ.get('WORKFLOW_DB_PATH', 'workflow_engine.db')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS graphs (id TEXT PRIMARY KEY, blob BLOB)',
+    'CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, blob BLOB)',
+    'CREATE TABLE IF NOT EXISTS function_cache (code_sha BLOB PRIMARY KEY, functions BLOB)',
+)
+
+_JSON_PREFIX = b'json:'
+_JSON_SCALARS = (str, int, float, bool, type(None))
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        _local.conn = conn
+    return conn
+
+def _check_storable(value: Any):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(f'cannot store non-string key {key!r}')
+            _check_storable(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _check_storable(item)
+    elif not isinstance(value, _JSON_SCALARS):
+        raise TypeError(f'cannot store value of type {type(value).__name__}')
+
+def _dumps(value: Any) -> bytes:
+    try:
+        return orjson.dumps(value, option=_ORJSON_OPTIONS)
+    except TypeError:
+        _check_storable(value)
+        return _JSON_PREFIX + json.dumps(value).encode('utf-8')
+
+def _loads(blob: bytes) -> Any:
+    if blob.startswith(_JSON_PREFIX):
+        return json.loads(blob[len(_JSON_PREFIX):])
+    return orjson.loads(blob)
+
+class BlobTable:
+    def __init__(self, table: str, maxsize: int = 256):
+        self.table = table
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._rows = None
+    
+    def _remember(self, key: str, value: Any):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+    
+    def _select(self, key: str) -> Any:
+        row = _connection().execute(f'SELECT blob FROM {self.table} WHERE id = ?', (key,)).fetchone()
+        return None if row is None else _loads(row[0])
+    
+    def _insert(self, key: str, value: Any) -> Tuple[bytes, bool]:
+        blob = _dumps(value)
+        conn = _connection()
+        inserted = conn.execute(f'INSERT OR IGNORE INTO {self.table} (id, blob) VALUES (?, ?)', (key, blob)).rowcount == 1
+        if not inserted:
+            conn.execute(f'UPDATE {self.table} SET blob = ? WHERE id = ?', (blob, key))
+        return blob, inserted
+    
+    def _count(self) -> int:
+        return _connection().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+    
+    async def get(self, key: str, default: Any = None) -> Any:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        
+        value = await asyncio.to_thread(self._select, key)
+        if value is None:
+            return default
+        self._remember(key, value)
+        return value
+    
+    async def set(self, key: str, value: Any):
+        blob, inserted = await asyncio.to_thread(self._insert, key, value)
+        if inserted and self._rows is not None:
+            self._rows += 1
+        self._remember(key, _loads(blob))
+    
+    async def count(self) -> int:
+        if self._rows is None:
+            self._rows = await asyncio.to_thread(self._count)
+        return self._rows
+
+def _function_cache_key(code: str, version: int) -> bytes:
+    return sha256(b'%d:' % version + code.encode('utf-8', 'surrogatepass')).digest()
+
+def load_functions(code: str, version: int) -> Optional[list]:
+    row = _connection().execute(
+        'SELECT functions FROM function_cache WHERE code_sha = ?', (_function_cache_key(code, version),)
+    ).fetchone()
+    return None if row is None else _loads(row[0])
+
+def store_functions(code: str, version: int, functions: list):
+    _connection().execute(
+        'INSERT OR REPLACE INTO function_cache (code_sha, functions) VALUES (?, ?)',
+        (_function_cache_key(code, version), _dumps(functions))
+    )
@@ -0,0 +1,111 @@
+import pytest
+
+from conditions import MISSING, compile_condition, condition_paths, resolve_path
+
+STATE = {
+    'score': 7,
+    'name': 'review',
+    'flags': {'strict': True, 'tags': ['a', 'b']},
+    'items': [1, 2, 3],
+    'missing_value': None,
+}
+
+@pytest.mark.parametrize('condition, expected', [
+    ("state['score'] > 5", True),
+    ("state['score'] == 7 and state['name'] != 'x'", True),
+    ("state['score'] < 5 or state['flags']['strict']", True),
+    ("not state['flags']['strict']", False),
+    ("state.get('absent') is None", True),
+    ("state.get('absent', 3) == 3", True),
+    ("state.get('score', 100) < 70", True),
+    ("state['flags'].get('tags', [])[1] == 'b'", True),
+    ("state.get('missing_value', 1) is None", True),
+    ("'a' in state['flags']['tags']", True),
+    ("'z' not in state['flags']['tags']", True),
+    ("state[state['name'][0:0] + 'score'] == 7", True),
+])
+def test_compile_condition_matches_python(condition, expected):
+    assert compile_condition(condition)(STATE) is expected
+    assert bool(eval(condition, {'__builtins__': {}}, {'state': STATE})) is expected
+
+@pytest.mark.parametrize('condition, expected', [
+    ("1 < state['score'] < 10", True),
+    ("1 < state['score'] < 5", False),
+    ("0 < state['items'][0] <= state['items'][1] < state['items'][2]", True),
+    ("3 > state['score'] > 1", False),
+])
+def test_compile_condition_chained_compares(condition, expected):
+    assert compile_condition(condition)(STATE) is expected
+
+def test_compile_condition_evaluates_chained_operands_once():
+    calls = []
+    
+    class Counted(dict):
+        def __getitem__(self, key):
+            calls.append(key)
+            return dict.__getitem__(self, key)
+    
+    assert compile_condition("1 < state['score'] < 10")(Counted(STATE)) is True
+    assert calls == ['score']
+
+def test_compile_condition_falls_back_to_eval_for_unsupported_syntax():
+    assert compile_condition("state['score'] * 2 > 10")(STATE) is True
+    assert compile_condition("[x for x in state['items'] if x > 1] == [2, 3]")(STATE) is True
+
+def test_compile_condition_eval_fallback_has_no_builtins():
+    assert compile_condition("len(state['items']) == 3")(STATE) is False
+
+@pytest.mark.parametrize('condition', [None, ''])
+def test_compile_condition_without_condition(condition):
+    assert compile_condition(condition) is None
+
+def test_compile_condition_rejects_invalid_syntax():
+    assert compile_condition("state['score'] >")(STATE) is False
+
+@pytest.mark.parametrize('condition', [
+    "state['absent'] > 1",
+    "state['items'][10] == 1",
+    "state['name'] > 1",
+    "state['score'].get('x')",
+])
+def test_compile_condition_errors_are_false(condition):
+    assert compile_condition(condition)(STATE) is False
+
+def test_condition_paths_projects_subscripts_and_gets():
+    assert condition_paths("state.get('quality_score', 100) < 70 and state['_meta']['iterations'] < 3") == (
+        ('_meta', 'iterations'),
+        ('quality_score',),
+    )
+
+def test_condition_paths_merges_subscript_and_get_on_one_path():
+    assert condition_paths("state['m']['x'] == 1 or state['m'].get('x') is None") == (('m', 'x'),)
+
+@pytest.mark.parametrize('condition', [None, '', "state['score'] >"])
+def test_condition_paths_without_reads(condition):
+    assert condition_paths(condition) == ()
+
+@pytest.mark.parametrize('condition', [
+    "state == {}",
+    "state[state['key']] > 1",
+    "len(state['items']) > 1",
+    "state.get(state['key']) is None",
+    "[x for x in state['items']]",
+])
+def test_condition_paths_is_none_when_reads_cannot_be_projected(condition):
+    assert condition_paths(condition) is None
+
+def test_resolve_path_returns_value_and_container_types():
+    assert resolve_path(STATE, ('score',)) == ((), 7)
+    assert resolve_path(STATE, ('flags', 'tags', 1)) == ((dict, list), 'b')
+
+def test_resolve_path_missing_at_top_level():
+    assert resolve_path(STATE, ('absent',)) == ((), MISSING)
+
+@pytest.mark.parametrize('path, containers', [
+    (('flags', 'absent'), (dict,)),
+    (('items', 'x'), (list,)),
+    (('score', 'x'), (int,)),
+    (('items', 10), (list,)),
+])
+def test_resolve_path_missing_below_top_level_reports_containers(path, containers):
+    assert resolve_path(STATE, path) == (containers, MISSING)
@@ -0,0 +1,103 @@
+import pytest
+
+import main
+from main import EdgeConfig, NodeConfig, WorkflowEngine
+
+@pytest.fixture
+def predicate_calls(monkeypatch):
+    calls = []
+    compile_condition = main.compile_condition
+    
+    def compile_counted(condition):
+        predicate = compile_condition(condition)
+        if predicate is None:
+            return None
+        def counted(state):
+            calls.append(condition)
+            return predicate(state)
+        return counted
+    
+    monkeypatch.setattr(main, 'compile_condition', compile_counted)
+    return calls
+
+def _template(edges):
+    names = dict.fromkeys(name for source, target, _ in edges for name in (source, target))
+    return WorkflowEngine.build_template(
+        [NodeConfig(name=name, tool=name) for name in names],
+        [EdgeConfig(from_node=source, to_node=target, condition=condition) for source, target, condition in edges]
+    )
+
+def _engine(template):
+    return WorkflowEngine.from_template('graph', template)
+
+def _state(**values):
+    return {'_meta': {'iterations': 0, 'max_iterations': 50}, **values}
+
+def test_route_cache_hits_across_runs_of_one_template(predicate_calls):
+    template = _template([
+        ('improve', 'improve', "state.get('quality_score', 100) < 70 and state['_meta']['iterations'] < 3"),
+    ])
+    state = _state(quality_score=40)
+    
+    assert _engine(template)._get_next_nodes('improve', state) == ('improve',)
+    assert len(predicate_calls) == 1
+    
+    assert _engine(template)._get_next_nodes('improve', state) == ('improve',)
+    assert len(predicate_calls) == 1
+
+def test_route_cache_misses_when_a_read_value_changes(predicate_calls):
+    engine = _engine(_template([('a', 'b', "state['score'] > 5"), ('a', 'c', None)]))
+    
+    assert engine._get_next_nodes('a', _state(score=10)) == ('b',)
+    assert engine._get_next_nodes('a', _state(score=1)) == ('c',)
+    assert engine._get_next_nodes('a', _state(score=10.0)) == ('b',)
+    assert len(predicate_calls) == 3
+
+def test_route_cache_keeps_missing_keys_apart_from_wrong_containers():
+    engine = _engine(_template([('a', 'b', "state['m'].get('x') is None"), ('a', 'c', None)]))
+    
+    assert engine._get_next_nodes('a', _state(m={})) == ('b',)
+    assert engine._get_next_nodes('a', _state(m=[1])) == ('c',)
+    assert engine._get_next_nodes('a', _state(m={})) == ('b',)
+
+def test_route_cache_keys_on_container_types():
+    engine = _engine(_template([('a', 'b', "state['m'].get(0) == 5"), ('a', 'c', None)]))
+    
+    assert engine._get_next_nodes('a', _state(m={0: 5})) == ('b',)
+    assert engine._get_next_nodes('a', _state(m=[5])) == ('c',)
+
+def test_route_cache_is_skipped_for_unprojectable_conditions(predicate_calls):
+    engine = _engine(_template([('a', 'b', "state[state['key']] > 1"), ('a', 'c', None)]))
+    
+    assert engine._get_next_nodes('a', _state(key='score', score=2)) == ('b',)
+    assert engine._get_next_nodes('a', _state(key='score', score=2)) == ('b',)
+    assert len(predicate_calls) == 2
+    assert not engine._route_cache
+
+def test_get_next_nodes_fans_out_unconditional_edges():
+    engine = _engine(_template([('a', 'b', None), ('a', 'c', None), ('a', 'b', None)]))
+    
+    assert engine._get_next_nodes('a', _state()) == ('b', 'c')
+    assert engine._get_next_nodes('b', _state()) == ()
+
+def test_get_next_nodes_takes_the_first_matching_condition(predicate_calls):
+    engine = _engine(_template([
+        ('a', 'b', "state['score'] > 5"),
+        ('a', 'c', "state['score'] > 1"),
+        ('a', 'd', None),
+    ]))
+    
+    assert engine._get_next_nodes('a', _state(score=10)) == ('b',)
+    assert engine._get_next_nodes('a', _state(score=3)) == ('c',)
+    assert engine._get_next_nodes('a', _state(score=0)) == ('d',)
+    assert engine._get_next_nodes('a', _state(score=3)) == ('c',)
+    assert len(predicate_calls) == 5
+
+def test_route_cache_treats_an_absent_top_level_key_as_a_value(predicate_calls):
+    engine = _engine(_template([('a', 'b', "state.get('done') is None"), ('a', 'c', None)]))
+    
+    assert engine._get_next_nodes('a', _state()) == ('b',)
+    assert engine._get_next_nodes('a', _state()) == ('b',)
+    assert engine._get_next_nodes('a', _state(done=None)) == ('b',)
+    assert engine._get_next_nodes('a', _state(done=True)) == ('c',)
+    assert len(predicate_calls) == 3